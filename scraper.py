@@ -8,27 +8,37 @@ The HTML currently encodes red as rgb(255, 42, 0) and also uses #ff2a00 in the e
 
 from __future__ import annotations
 
+import hashlib
+import io
+import json
+import os
 import re
 import uuid
 from dataclasses import dataclass
 from datetime import datetime, date, time, timedelta
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
 from zoneinfo import ZoneInfo
 
+import lxml.html as LH
 import requests
-from bs4 import BeautifulSoup, Tag
+from lxml import etree
 
 SCHEDULE_URL = "https://mtolympusgym.us/pages/weekly-schedule"
 TZ = ZoneInfo("America/New_York")
 
-# Known "red" encodings seen in your HTML dump
-RED_MARKERS = {
-    "rgb(255, 42, 0)",
-    "rgb(255,42,0)",
-    "#ff2a00",
-    "#FF2A00",
-}
+OUT_PATH = "gym-closed.ics"
+# ETag / Last-Modified of the last fetched page, for conditional GETs on the next run
+HTTP_CACHE_PATH = ".http-cache.json"
+
+# Known "red" encodings seen in your HTML dump, plus generic "color: red" if they ever switch
+RED_RE = re.compile(
+    r"rgb\(\s*255\s*,\s*42\s*,\s*0\s*\)|#ff2a00|color\s*:\s*red",
+    re.IGNORECASE,
+)
 
 DAYS = ["MONDAY", "TUESDAY", "WEDNESDAY", "THURSDAY", "FRIDAY", "SATURDAY", "SUNDAY"]
+DAYS_SET = frozenset(DAYS)
 
 
 @dataclass(frozen=True)
@@ -38,16 +48,34 @@ class ClosedBlock:
     end: time
 
 
+# The schedule content appears inside the rich text area (rte)
+RTE_XPATH = etree.XPath('//div[contains(concat(" ", normalize-space(@class), " "), " rte ")]')
+
+# Everything extract_blocks looks at, in one query and in document order: non-empty paragraphs
+# without "Training" (the day header candidates) and the red Training spans between them.
+# Spacer paragraphs (<p><br></p>) never reach Python, and the cheap substring test runs
+# first so RED_RE (via EXSLT regular expressions) only sees Training spans.
+SCHEDULE_NODES_XPATH = etree.XPath(
+    './/*[(self::p or self::div) and normalize-space() and not(contains(., "Training"))]'
+    f' | .//span[contains(., "Training") and re:test(@style, "{RED_RE.pattern}", "i")]',
+    namespaces={"re": "http://exslt.org/regular-expressions"},
+)
+
+# Matched at the position right after a "Training", so it is anchored and never scans.
+# ASCII-only matching skips Unicode case folding; the only non-ASCII character the editor
+# puts in these lines is &nbsp;, which is listed explicitly next to \s
 TIME_RANGE_RE = re.compile(
-    r"Training\s+(\d{1,2}:\d{2}\s*(?:am|pm))\s*-\s*(\d{1,2}:\d{2}\s*(?:am|pm))",
-    re.IGNORECASE,
+    r"[\s\xa0]*(\d{1,2}:\d{2}[\s\xa0]*[ap]m)[\s\xa0]*-[\s\xa0]*(\d{1,2}:\d{2}[\s\xa0]*[ap]m)",
+    re.ASCII | re.IGNORECASE,
 )
 
 
+@lru_cache(maxsize=256)
 def parse_ampm(t: str) -> time:
     t = t.strip().lower().replace(" ", "")
-    dt = datetime.strptime(t, "%I:%M%p")
-    return dt.time().replace(second=0, microsecond=0)
+    # "6:00am" -> 06:00; a straight integer parse instead of strptime("%I:%M%p")
+    h, m = t[:-2].split(":")
+    return time(int(h) % 12 + (12 if t[-2:] == "pm" else 0), int(m))
 
 
 def monday_of_week(d: date) -> date:
@@ -56,165 +84,245 @@ def monday_of_week(d: date) -> date:
 
 def normalize_day(s: str) -> str | None:
     s = s.strip().upper().rstrip(":")
-    return s if s in DAYS else None
+    return s if s in DAYS_SET else None
+
+
+def node_text(el: etree._Element) -> str:
+    # Same as BeautifulSoup's get_text(" ", strip=True): stripped text fragments joined by spaces
+    return " ".join(t for t in map(str.strip, el.itertext()) if t)
+
 
+def node_string(el: etree._Element) -> str | None:
+    # Like BeautifulSoup's Tag.string: the text of an element holding a single string,
+    # possibly through a chain of single-child tags (<p><strong><u>MONDAY:</u></strong></p>)
+    while len(el) == 1 and not (el.text or "").strip() and not (el[0].tail or "").strip():
+        el = el[0]
+    return None if len(el) else el.text or ""
 
-def style_has_red(style: str | None) -> bool:
-    if not style:
-        return False
-    s = style.lower().replace(" ", "")
-    # Look for any known red marker
-    for marker in RED_MARKERS:
-        if marker.lower().replace(" ", "") in s:
-            return True
-    # Also allow generic "color: red" if they ever switch
-    return "color:red" in s
 
+def match_time_range(text: str) -> re.Match[str] | None:
+    # Usually the range follows the first "Training", but labels like
+    # "Personal Training / Small Group Training 6:00am-7:00am" put it after a later one
+    pos = text.find("Training")
+    while pos != -1:
+        pos += len("Training")
+        m = TIME_RANGE_RE.match(text, pos)
+        if m:
+            return m
+        pos = text.find("Training", pos)
+    return None
 
-def extract_blocks(html: str) -> list[ClosedBlock]:
-    soup = BeautifulSoup(html, "html.parser")
 
-    # The schedule content appears inside the rich text area (rte)
-    rte = soup.select_one("div.rte")
+def extract_blocks(html: str | bytes, encoding: str | None = None) -> list[ClosedBlock]:
+    # encoding is for bytes input: the charset from the HTTP headers. Without it libxml2 goes
+    # by the page's <meta charset>, and falls back to Latin-1 when there is none
+    parser = LH.HTMLParser(encoding=encoding) if encoding else None
+    tree = LH.fromstring(html, parser=parser)
+
+    rte = next(iter(RTE_XPATH(tree)), None)
     if rte is None:
         raise RuntimeError("Could not find schedule container (div.rte). Page structure may have changed.")
 
     blocks: list[ClosedBlock] = []
     current_day: str | None = None
 
-    # Iterate over paragraphs; day headers are bold/underlined text like "MONDAY:"
-    for p in rte.find_all(["p", "div"], recursive=True):
-        text = p.get_text(" ", strip=True)
-        if not text:
+    for node in SCHEDULE_NODES_XPATH(rte):
+        if node.tag == "span":
+            # Training lines: we care only when the *span that contains the text* is red
+            # Many lines are like: <p><span style="color: rgb(255, 42, 0);">Training 6:00am-7:00am</span></p>
+            if current_day is None:
+                continue
+
+            m = match_time_range(node_text(node))
+            if not m:
+                continue
+
+            start_t = parse_ampm(m.group(1))
+            end_t = parse_ampm(m.group(2))
+            blocks.append(ClosedBlock(day_name=current_day, start=start_t, end=end_t))
             continue
 
-        # Detect day headers
+        # Day headers are bold/underlined text like "MONDAY:". Most paragraphs hold a single
+        # string; only walk the subtree when they don't
+        string = node_string(node)
+        text = string.strip() if string is not None else node_text(node)
+
         day = normalize_day(text)
         if day:
             current_day = day
-            continue
 
-        if current_day is None:
-            continue
+    return blocks
 
-        # Training lines: we care only when the *span that contains the text* is red
-        # Many lines are like: <p><span style="color: rgb(255, 42, 0);">Training 6:00am-7:00am</span></p>
-        spans = p.find_all("span")
-        if not spans:
-            continue
 
-        for sp in spans:
-            if not isinstance(sp, Tag):
-                continue
-            sp_text = sp.get_text(" ", strip=True)
-            if not sp_text or "Training" not in sp_text:
-                continue
+_ICS_ESCAPES = str.maketrans({"\\": "\\\\", "\n": "\\n", ",": "\\,", ";": "\\;"})
 
-            m = TIME_RANGE_RE.search(sp_text)
-            if not m:
-                continue
 
-            if style_has_red(sp.get("style")):
-                start_t = parse_ampm(m.group(1))
-                end_t = parse_ampm(m.group(2))
-                blocks.append(ClosedBlock(day_name=current_day, start=start_t, end=end_t))
+def ics_escape(s: str) -> str:
+    return s.translate(_ICS_ESCAPES)
+
+
+# Minimal VTIMEZONE for America/New_York (works well for subscriptions).
+# Many clients also work fine without VTIMEZONE, but including it helps.
+# Lines end in CRLF like the rest of the calendar.
+VTIMEZONE_AMERICA_NEW_YORK = (
+    "BEGIN:VTIMEZONE\r\n"
+    "TZID:America/New_York\r\n"
+    "X-LIC-LOCATION:America/New_York\r\n"
+    "BEGIN:DAYLIGHT\r\n"
+    "TZOFFSETFROM:-0500\r\n"
+    "TZOFFSETTO:-0400\r\n"
+    "TZNAME:EDT\r\n"
+    "DTSTART:19700308T020000\r\n"
+    "RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=2SU\r\n"
+    "END:DAYLIGHT\r\n"
+    "BEGIN:STANDARD\r\n"
+    "TZOFFSETFROM:-0400\r\n"
+    "TZOFFSETTO:-0500\r\n"
+    "TZNAME:EST\r\n"
+    "DTSTART:19701101T020000\r\n"
+    "RRULE:FREQ=YEARLY;BYMONTH=11;BYDAY=1SU\r\n"
+    "END:STANDARD\r\n"
+    "END:VTIMEZONE\r\n"
+)
 
-    return blocks
 
+_NAMESPACE_URL_BYTES = uuid.NAMESPACE_URL.bytes
 
-def ics_escape(s: str) -> str:
-    return s.replace("\\", "\\\\").replace("\n", "\\n").replace(",", "\\,").replace(";", "\\;")
-
-
-def format_dt(dt: datetime) -> str:
-    # ICS local time with TZID
-    return dt.strftime("%Y%m%dT%H%M%S")
-
-
-def vtimezone_america_new_york() -> str:
-    # Minimal VTIMEZONE for America/New_York (works well for subscriptions).
-    # Many clients also work fine without VTIMEZONE, but including it helps.
-    return """BEGIN:VTIMEZONE
-TZID:America/New_York
-X-LIC-LOCATION:America/New_York
-BEGIN:DAYLIGHT
-TZOFFSETFROM:-0500
-TZOFFSETTO:-0400
-TZNAME:EDT
-DTSTART:19700308T020000
-RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=2SU
-END:DAYLIGHT
-BEGIN:STANDARD
-TZOFFSETFROM:-0400
-TZOFFSETTO:-0500
-TZNAME:EST
-DTSTART:19701101T020000
-RRULE:FREQ=YEARLY;BYMONTH=11;BYDAY=1SU
-END:STANDARD
-END:VTIMEZONE
-"""
+
+def uuid5_url(name: str) -> str:
+    # Same string as str(uuid.uuid5(uuid.NAMESPACE_URL, name)), minus the UUID object
+    raw = bytearray(hashlib.sha1(_NAMESPACE_URL_BYTES + name.encode()).digest()[:16])
+    raw[6] = (raw[6] & 0x0F) | 0x50  # version 5
+    raw[8] = (raw[8] & 0x3F) | 0x80  # RFC 4122 variant
+    h = raw.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
 
 
 def build_ics(blocks: list[ClosedBlock], week_start: date) -> str:
     # Map day to date in the target week
-    day_to_offset = {day: i for i, day in enumerate(DAYS)}
+    day_to_date = {day: week_start + timedelta(days=i) for i, day in enumerate(DAYS)}
 
     now_utc = datetime.now(tz=ZoneInfo("UTC")).strftime("%Y%m%dT%H%M%SZ")
-
-    lines: list[str] = []
-    lines.append("BEGIN:VCALENDAR")
-    lines.append("VERSION:2.0")
-    lines.append("PRODID:-//kmonopoli//mt-olympus-closed//EN")
-    lines.append("CALSCALE:GREGORIAN")
-    lines.append("METHOD:PUBLISH")
-    lines.append(vtimezone_america_new_york().strip())
+    description = ics_escape(f"Mt. Olympus Open Gym unavailable (red slot). Source: {SCHEDULE_URL}")
+
+    buf = io.StringIO()
+    buf.write(
+        "BEGIN:VCALENDAR\r\n"
+        "VERSION:2.0\r\n"
+        "PRODID:-//kmonopoli//mt-olympus-closed//EN\r\n"
+        "CALSCALE:GREGORIAN\r\n"
+        "METHOD:PUBLISH\r\n"
+    )
+    buf.write(VTIMEZONE_AMERICA_NEW_YORK)
 
     for b in blocks:
-        event_date = week_start + timedelta(days=day_to_offset[b.day_name])
-        dt_start = datetime.combine(event_date, b.start, tzinfo=TZ)
-        dt_end = datetime.combine(event_date, b.end, tzinfo=TZ)
+        event_date = day_to_date[b.day_name]
 
-        uid = f"{uuid.uuid5(uuid.NAMESPACE_URL, f'{event_date}-{b.start}-{b.end}')}" \
-              f"@mtolympusgym.us"
+        uid = f"{uuid5_url(f'{event_date}-{b.start}-{b.end}')}@mtolympusgym.us"
 
         summary = f"Gym Closed (PT) [{b.day_name.title()}]"
-        description = f"Mt. Olympus Open Gym unavailable (red slot). Source: {SCHEDULE_URL}"
-
-        lines.append("BEGIN:VEVENT")
-        lines.append(f"UID:{uid}")
-        lines.append(f"DTSTAMP:{now_utc}")
-        lines.append(f"DTSTART;TZID=America/New_York:{format_dt(dt_start)}")
-        lines.append(f"DTEND;TZID=America/New_York:{format_dt(dt_end)}")
-        lines.append(f"SUMMARY:{ics_escape(summary)}")
-        lines.append(f"DESCRIPTION:{ics_escape(description)}")
-        lines.append("STATUS:CONFIRMED")
-        lines.append("TRANSP:OPAQUE")
-        lines.append("END:VEVENT")
 
-    lines.append("END:VCALENDAR")
+        # One f-string per event; start/end are ICS local times with TZID
+        buf.write(
+            "BEGIN:VEVENT\r\n"
+            f"UID:{uid}\r\n"
+            f"DTSTAMP:{now_utc}\r\n"
+            f"DTSTART;TZID=America/New_York:{event_date:%Y%m%d}T{b.start:%H%M%S}\r\n"
+            f"DTEND;TZID=America/New_York:{event_date:%Y%m%d}T{b.end:%H%M%S}\r\n"
+            f"SUMMARY:{ics_escape(summary)}\r\n"
+            f"DESCRIPTION:{description}\r\n"
+            "STATUS:CONFIRMED\r\n"
+            "TRANSP:OPAQUE\r\n"
+            "END:VEVENT\r\n"
+        )
+
+    buf.write("END:VCALENDAR\r\n")
 
     # Fold long lines to 75 octets is ideal, but most clients are forgiving.
     # If you want strict folding later, we can add it.
-    return "\r\n".join(lines) + "\r\n"
+    return buf.getvalue()
 
 
-def main() -> None:
-    resp = requests.get(SCHEDULE_URL, timeout=30)
-    resp.raise_for_status()
+def load_http_cache() -> dict[str, str]:
+    try:
+        with open(HTTP_CACHE_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
 
-    blocks = extract_blocks(resp.text)
+def save_http_cache(resp: requests.Response, week_start: date) -> None:
+    cache = {"week_start": week_start.isoformat()}
+    if "ETag" in resp.headers:
+        cache["etag"] = resp.headers["ETag"]
+    if "Last-Modified" in resp.headers:
+        cache["last_modified"] = resp.headers["Last-Modified"]
+    with open(HTTP_CACHE_PATH, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2)
+        f.write("\n")
 
+
+def modified_since(resp: requests.Response, last_modified: str | None) -> bool:
+    # Without usable Last-Modified values on both sides, assume the page changed
+    current = resp.headers.get("Last-Modified")
+    if not current or not last_modified:
+        return True
+    try:
+        return parsedate_to_datetime(current) > parsedate_to_datetime(last_modified)
+    except (TypeError, ValueError):
+        return True
+
+
+def main() -> None:
     # Put events on the current week (Mon-Sun) in America/New_York
     today = datetime.now(TZ).date()
     week_start = monday_of_week(today)
 
+    cache = load_http_cache()
+    # The existing .ics can only be reused while it still covers this week
+    reusable = cache.get("week_start") == week_start.isoformat() and os.path.exists(OUT_PATH)
+
+    with requests.Session() as session:
+        headers: dict[str, str] = {}
+        if reusable:
+            # HEAD first: if the page hasn't changed since the last fetch, skip the download.
+            # Compared against the saved header, not the .ics mtime, which a fresh checkout resets
+            # The HEAD is only a shortcut; if it fails for any reason, fall through to the GET
+            try:
+                head = session.head(SCHEDULE_URL, timeout=15)
+            except requests.RequestException:
+                head = None
+            if head is not None and head.ok and not modified_since(head, cache.get("last_modified")):
+                print(f"Schedule not modified; kept {OUT_PATH} for week starting {week_start}.")
+                return
+
+            # Otherwise make the GET conditional on the validators from the last run
+            if "etag" in cache:
+                headers["If-None-Match"] = cache["etag"]
+            if "last_modified" in cache:
+                headers["If-Modified-Since"] = cache["last_modified"]
+
+        with session.get(SCHEDULE_URL, timeout=30, headers=headers, stream=True) as resp:
+            if resp.status_code == 304:
+                print(f"Schedule not modified; kept {OUT_PATH} for week starting {week_start}.")
+                return
+            resp.raise_for_status()
+            # Raw bytes, decoded by lxml rather than into resp.text first. Pass the charset on
+            # only when Content-Type names one: requests reports ISO-8859-1 for any text/*
+            # response without it, which would override a <meta charset> in the page
+            html = resp.content
+            has_charset = "charset=" in resp.headers.get("Content-Type", "").lower()
+            encoding = resp.encoding if has_charset else None
+
+    blocks = extract_blocks(html, encoding)
+
     ics = build_ics(blocks, week_start)
 
-    out_path = "gym-closed.ics"
-    with open(out_path, "w", encoding="utf-8", newline="") as f:
+    with open(OUT_PATH, "w", encoding="utf-8", newline="") as f:
         f.write(ics)
+    save_http_cache(resp, week_start)
 
-    print(f"Wrote {out_path} with {len(blocks)} closed blocks for week starting {week_start}.")
+    print(f"Wrote {OUT_PATH} with {len(blocks)} closed blocks for week starting {week_start}.")
 
 
 if __name__ == "__main__":